@@ -1,7 +1,43 @@
+from __future__ import annotations # Anotaciones como 'list[Paquete]' también en Python 3.8
+
+import asyncio
+import logging
+import math
 import random
+import re
+import socket
+import sys
+import threading
 import time
 from abc import ABC, abstractmethod # Importamos ABC para clases abstractas
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable
+
+# Toda la salida por paquete pasa por 'logging' en lugar de print().
+# Sin un handler configurado (ej: modo batch/benchmark) los mensajes se descartan;
+# la consola interactiva los muestra en stdout (ver mensajes_en_consola).
+logger = logging.getLogger("netguard")
+logger.addHandler(logging.NullHandler())
+
+
+@contextmanager
+def mensajes_en_consola():
+    """
+    Muestra los mensajes de la red en stdout mientras dure el bloque 'with'.
+    Van al mismo flujo que los print() del menú, así la sesión se puede
+    redirigir entera a un archivo. Al salir se quita el handler.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    nivel_anterior = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    try:
+        yield
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(nivel_anterior)
 
 # --- 1. Excepciones Personalizadas ---
 # Es una buena práctica definir tus propias excepciones
@@ -19,17 +55,36 @@ class PaqueteCorruptoError(ErrorSimulacion):
 
 # --- 2. Clase Paquete (Mejorada con Validación) ---
 
+def _ip_to_int(ip: str):
+    """
+    Convierte una IPv4 ("1.2.3.4") a un entero de 32 bits.
+    Los enteros se hashean y comparan más rápido que los strings en
+    sets y diccionarios. Si no es una IPv4 válida (ej: IPv6 o vacía),
+    se devuelve el valor original para que siga sirviendo como clave.
+    """
+    try:
+        return int.from_bytes(socket.inet_aton(ip), "big")
+    except (OSError, TypeError, ValueError):
+        return ip
+
 class Paquete:
     """
     Representa un paquete de red.
     Ahora incluye un método de validación.
     """
+    # Sin __dict__ por instancia: menos memoria y acceso a atributos más rápido,
+    # importante cuando se procesan millones de paquetes.
+    __slots__ = ("origen", "destino", "tipo", "datos", "nivel_amenaza", "origen_int")
+
     def __init__(self, origen: str, destino: str, tipo: str, datos: str, nivel_amenaza: int):
         self.origen = origen
         self.destino = destino
         self.tipo = tipo
         self.datos = datos
         self.nivel_amenaza = nivel_amenaza
+        # Precalculamos la IP de origen como entero UNA vez por paquete;
+        # los detectores la usan como clave en vez del string.
+        self.origen_int = _ip_to_int(origen)
 
     def __repr__(self) -> str:
         return (f"[Paquete] Origen: {self.origen:<15} | Destino: {self.destino:<15} | "
@@ -53,6 +108,19 @@ class DetectorBase(ABC):
     Define el "contrato" que todos los detectores DEBEN seguir.
     No se puede instanciar (crear un objeto) de esta clase.
     """
+    # ¿El veredicto depende SOLO del contenido del paquete?
+    # Si es True, la Red puede reutilizar el veredicto de paquetes idénticos.
+    # Por defecto es False: un detector con estado (ej: heurístico) nunca se cachea.
+    es_cacheable: bool = False
+    # Versión de la configuración del detector. Un detector cacheable que
+    # cambia su configuración (ver _configuracion_cambiada) la incrementa, y
+    # la Red descarta los veredictos que guardó con la configuración vieja.
+    _version: int = 0
+
+    def _configuracion_cambiada(self):
+        """Avisa que cambió la configuración: los veredictos cacheados ya no valen."""
+        self._version += 1
+
     @abstractmethod
     def analizar_paquete(self, paquete: Paquete) -> (bool, str):
         """
@@ -61,6 +129,48 @@ class DetectorBase(ABC):
         """
         pass
 
+    def analizar_lote(self, paquetes: list[Paquete], tiempo: float) -> list[bool]:
+        """
+        Analiza varios paquetes de una vez (en orden).
+        'tiempo' es el timestamp de llegada del lote (uno solo para todo el lote).
+        Retorna una lista con 'es_amenaza' para cada paquete.
+        Los detectores concretos pueden sobreescribirlo con una versión más rápida.
+        """
+        return [self.analizar_paquete(paquete)[0] for paquete in paquetes]
+
+    def _fuente_cadena(self, nombre: str) -> tuple[str, dict]:
+        """
+        Código fuente que la Red "pega" dentro de su cadena compilada
+        (ver _compilar_cadena). El fragmento recibe el paquete como 'p' y
+        debe hacer 'return (detector, razon)' si lo bloquea; si no, sigue de largo.
+        'nombre' es un prefijo único para las variables que el fragmento usa.
+        Retorna (fuente, variables_que_necesita).
+        Por defecto simplemente llama a analizar_paquete().
+        """
+        fuente = (f"    es_amenaza, razon = {nombre}_analizar(p)\n"
+                  f"    if es_amenaza:\n"
+                  f"        return ({nombre}, razon)\n")
+        return fuente, {nombre: self, f"{nombre}_analizar": self.analizar_paquete}
+
+    def _fuente_detectar(self, nombre: str) -> tuple[str, dict]:
+        """
+        Fragmento para detectores con un método '_detectar(paquete)' que retorna
+        la razón del bloqueo o None: se llama directo, sin armar la tupla
+        (es_amenaza, razon) en el camino benigno.
+        """
+        fuente = (f"    razon = {nombre}_detectar(p)\n"
+                  f"    if razon is not None:\n"
+                  f"        return ({nombre}, razon)\n")
+        return fuente, {nombre: self, f"{nombre}_detectar": self._detectar}
+
+    def _analiza_con(self, clase) -> bool:
+        """
+        ¿Este detector sigue usando el analizar_paquete() de 'clase'?
+        Si una subclase lo sobreescribió, los atajos de 'clase' (lote, cadena
+        compilada) no deben usarse: hay que llamar a SU analizar_paquete().
+        """
+        return type(self).analizar_paquete is clase.analizar_paquete
+
     def __repr__(self) -> str:
         # Nos da un nombre legible para los reportes
         return self.__class__.__name__
@@ -71,21 +181,116 @@ class DetectorPorReglas(DetectorBase):
     DETECTOR CONCRETO 1: El que ya teníamos.
     Implementa la interfaz 'DetectorBase'.
     """
+    es_cacheable = True
+
     def __init__(self, nivel_sensibilidad: int = 5):
-        self.nivel_sensibilidad = nivel_sensibilidad
+        self._nivel_sensibilidad = nivel_sensibilidad
+        # Preparamos las reglas UNA sola vez, no en cada paquete:
+        # - 'frozenset' para que 'in' sea O(1)
+        # - Regex precompilada e insensible a mayúsculas (evita crear un .upper() por paquete)
+        self._tipos_maliciosos = frozenset(("SCAN_PUERTOS", "DDoS", "MALWARE"))
+        self._patron_sqli = re.compile(r"SQL_INJECTION", re.IGNORECASE)
+
+    @property
+    def nivel_sensibilidad(self) -> int:
+        return self._nivel_sensibilidad
+
+    @nivel_sensibilidad.setter
+    def nivel_sensibilidad(self, valor: int):
+        # Cambiar el umbral invalida los veredictos cacheados por la Red
+        self._nivel_sensibilidad = valor
+        self._configuracion_cambiada()
 
     def analizar_paquete(self, paquete: Paquete) -> (bool, str):
-        if paquete.nivel_amenaza >= self.nivel_sensibilidad:
-            return (True, f"Nivel amenaza ({paquete.nivel_amenaza}) > umbral ({self.nivel_sensibilidad})")
+        razon = self._detectar(paquete)
+        if razon is not None:
+            return (True, razon)
+        return (False, "Tráfico benigno (Reglas)")
+
+    def _detectar(self, paquete: Paquete) -> str | None:
+        """Aplica las reglas. Retorna la razón si el paquete es sospechoso, o None."""
+        umbral = self._nivel_sensibilidad
+        if paquete.nivel_amenaza >= umbral:
+            return f"Nivel amenaza ({paquete.nivel_amenaza}) > umbral ({umbral})"
         
-        tipos_maliciosos = ["SCAN_PUERTOS", "DDoS", "MALWARE"]
-        if paquete.tipo in tipos_maliciosos:
-            return (True, f"Tipo de paquete sospechoso: {paquete.tipo}")
+        if paquete.tipo in self._tipos_maliciosos:
+            return f"Tipo de paquete sospechoso: {paquete.tipo}"
 
-        if "SQL_INJECTION" in paquete.datos.upper():
-            return (True, "Patrón de SQL Injection detectado")
+        if self._patron_sqli.search(paquete.datos):
+            return "Patrón de SQL Injection detectado"
+
+        return None
+
+    def analizar_lote(self, paquetes: list[Paquete], tiempo: float) -> list[bool]:
+        if not self._analiza_con(DetectorPorReglas):
+            return super().analizar_lote(paquetes, tiempo)
+        # Una sola pasada, sin armar la tupla (bool, razon) de cada paquete
+        detectar = self._detectar
+        return [detectar(p) is not None for p in paquetes]
+
+    def _fuente_cadena(self, nombre: str) -> tuple[str, dict]:
+        if not self._analiza_con(DetectorPorReglas):
+            return super()._fuente_cadena(nombre)
+        return self._fuente_detectar(nombre)
 
-        return (False, "Tráfico benigno (Reglas)")
+
+class FiltroBloom:
+    """
+    Filtro de Bloom mínimo (sin dependencias externas).
+    Responde "seguro que NO está" o "probablemente está" usando solo un
+    arreglo de bits: ~10 bits por elemento con 1% de falsos positivos,
+    frente a las decenas de bytes por elemento de un 'set'.
+    Pensado para elementos enteros (ej: IPs convertidas con _ip_to_int).
+    El tamaño se fija con 'capacidad': pasada esa cantidad de elementos la
+    tasa de falsos positivos se dispara, así que agregar() lanza ValueError.
+    """
+    def __init__(self, capacidad: int, tasa_error: float = 0.01):
+        if not 0 < tasa_error < 1:
+            raise ValueError(f"tasa_error debe estar entre 0 y 1 (exclusivo), se recibió {tasa_error}.")
+        self.capacidad = max(1, capacidad)
+        self.tasa_error = tasa_error
+        # Fórmulas estándar: m bits y k funciones hash óptimas para la tasa pedida
+        self._m = max(8, math.ceil(-self.capacidad * math.log(tasa_error) / math.log(2) ** 2))
+        self._k = max(1, round(self._m / self.capacidad * math.log(2)))
+        self._bits = bytearray((self._m + 7) // 8)
+        self._cantidad = 0
+
+    def _posiciones(self, elemento) -> tuple[int, int]:
+        # Doble hashing: las k posiciones salen de dos hashes (h1 + i*h2).
+        # hash() de un entero es el mismo entero, así que lo mezclamos con
+        # multiplicaciones: IPs consecutivas deben caer en bits lejanos.
+        x = hash(elemento) & 0xFFFFFFFFFFFFFFFF
+        h1 = ((x * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 16
+        h2 = ((x * 0xC2B2AE3D27D4EB4F) & 0xFFFFFFFFFFFFFFFF) >> 16 | 1
+        return h1, h2
+
+    @property
+    def lleno(self) -> bool:
+        return self._cantidad >= self.capacidad
+
+    def agregar(self, elemento):
+        if self.lleno:
+            raise ValueError(f"FiltroBloom lleno: capacidad de {self.capacidad} elementos alcanzada.")
+        h1, h2 = self._posiciones(elemento)
+        m, bits = self._m, self._bits
+        for i in range(self._k):
+            pos = (h1 + i * h2) % m
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self._cantidad += 1
+
+    def __contains__(self, elemento) -> bool:
+        h1, h2 = self._posiciones(elemento)
+        m, bits = self._m, self._bits
+        # Cortamos en el primer bit apagado: las IPs limpias salen al 1er o 2do intento
+        for i in range(self._k):
+            pos = (h1 + i * h2) % m
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        """Cantidad de elementos agregados (el filtro no puede listarlos)."""
+        return self._cantidad
 
 
 class DetectorReputacionIP(DetectorBase):
@@ -93,17 +298,97 @@ class DetectorReputacionIP(DetectorBase):
     DETECTOR CONCRETO 2: Revisa contra una "blacklist".
     Implementa la interfaz 'DetectorBase'.
     """
-    def __init__(self, ip_blacklist: set):
-        # Usamos un 'set' para búsquedas súper rápidas (O(1))
-        self.ip_blacklist = ip_blacklist
-        print(f"Detector de Reputación inicializado con {len(self.ip_blacklist)} IPs bloqueadas.")
+    es_cacheable = True
+
+    def __init__(self, ip_blacklist: set, usar_bloom: bool = False, tasa_error: float = 0.01,
+                 capacidad: int | None = None, solo_bloom: bool = False):
+        # Usamos un 'set' para búsquedas súper rápidas (O(1)),
+        # guardando las IPs como enteros (ver _ip_to_int).
+        # Es una COPIA: modificar después el set original no cambia la
+        # blacklist del detector; para eso está agregar_ip().
+        self.ip_blacklist = set(map(_ip_to_int, ip_blacklist))
+        # Para blacklists MUY grandes (millones de IPs) se puede anteponer un
+        # filtro de Bloom (usar_bloom=True): cabe en caché y descarta casi todas
+        # las IPs limpias sin tocar el 'set'; solo los "probablemente está" se
+        # confirman en él, así que nunca hay falsos positivos.
+        # Con solo_bloom=True el filtro REEMPLAZA al set: ocupa ~10 bits por IP
+        # en vez de decenas de bytes, a cambio de bloquear también cerca de un
+        # 'tasa_error' de las IPs limpias (falsos positivos).
+        # 'capacidad' es cuántas IPs debe aguantar el filtro (por defecto, las
+        # de la blacklist inicial); conviene reservar lugar si se usará agregar_ip().
+        self._bloom = None
+        self._solo_bloom = solo_bloom
+        if usar_bloom or solo_bloom:
+            capacidad = len(self.ip_blacklist) if capacidad is None else capacidad
+            if capacidad < len(self.ip_blacklist):
+                raise ValueError(f"capacidad ({capacidad}) menor que la blacklist ({len(self.ip_blacklist)} IPs).")
+            self._bloom = FiltroBloom(capacidad, tasa_error)
+            for ip in self.ip_blacklist:
+                self._bloom.agregar(ip)
+            if solo_bloom:
+                self.ip_blacklist = None
+        cantidad = len(self._bloom) if solo_bloom else len(self.ip_blacklist)
+        logger.info("Detector de Reputación inicializado con %d IPs bloqueadas.", cantidad)
+
+    def agregar_ip(self, ip: str):
+        """
+        Agrega una IP a la blacklist (y al filtro de Bloom, si se usa).
+        Si el filtro se llena, se reconstruye con el doble de capacidad a partir
+        del 'set'; con solo_bloom no hay de dónde reconstruirlo y se lanza ValueError.
+        """
+        ip_int = _ip_to_int(ip)
+        if self._solo_bloom:
+            if ip_int not in self._bloom:
+                self._bloom.agregar(ip_int)
+                self._configuracion_cambiada()
+            return
+        if ip_int in self.ip_blacklist:
+            return
+        self.ip_blacklist.add(ip_int)
+        self._configuracion_cambiada()
+        if self._bloom is not None:
+            if self._bloom.lleno:
+                self._reconstruir_bloom(2 * self._bloom.capacidad)
+            else:
+                self._bloom.agregar(ip_int)
+
+    def _reconstruir_bloom(self, capacidad: int):
+        """Arma un filtro nuevo (más grande) con todas las IPs del 'set'."""
+        bloom = FiltroBloom(max(capacidad, len(self.ip_blacklist)), self._bloom.tasa_error)
+        for ip in self.ip_blacklist:
+            bloom.agregar(ip)
+        self._bloom = bloom
 
     def analizar_paquete(self, paquete: Paquete) -> (bool, str):
-        if paquete.origen in self.ip_blacklist:
-            return (True, f"IP de origen ({paquete.origen}) está en la blacklist.")
-        
+        razon = self._detectar(paquete)
+        if razon is not None:
+            return (True, razon)
         return (False, "IP de origen confiable")
 
+    def _detectar(self, paquete: Paquete) -> str | None:
+        """Retorna la razón si la IP de origen está en la blacklist, o None."""
+        ip = paquete.origen_int
+        bloom = self._bloom
+        if bloom is not None:
+            if ip not in bloom:
+                return None # Seguro que NO está: ni tocamos el set
+            if self._solo_bloom:
+                return f"IP de origen ({paquete.origen}) probablemente en la blacklist (filtro de Bloom)."
+        if ip in self.ip_blacklist:
+            return f"IP de origen ({paquete.origen}) está en la blacklist."
+        return None
+
+    def analizar_lote(self, paquetes: list[Paquete], tiempo: float) -> list[bool]:
+        if not self._analiza_con(DetectorReputacionIP):
+            return super().analizar_lote(paquetes, tiempo)
+        detectar = self._detectar
+        return [detectar(p) is not None for p in paquetes]
+
+    def _fuente_cadena(self, nombre: str) -> tuple[str, dict]:
+        if not self._analiza_con(DetectorReputacionIP):
+            return super()._fuente_cadena(nombre)
+        return self._fuente_detectar(nombre)
+
 
 class DetectorHeuristico(DetectorBase):
     """
@@ -111,100 +396,322 @@ class DetectorHeuristico(DetectorBase):
     Busca comportamientos sospechosos a lo largo del tiempo.
     """
     def __init__(self, umbral_conexiones: int = 10, ventana_tiempo_seg: int = 5):
-        # Almacena el historial de conexiones por IP
-        # Ej: {'1.2.3.4': [timestamp1, timestamp2, ...]}
-        self.trafico_reciente = defaultdict(list)
         self.umbral = umbral_conexiones
         self.ventana = ventana_tiempo_seg
-        print("Detector Heurístico (Anti-DDoS/Scan) inicializado.")
+        # Almacena el historial de conexiones por IP
+        # La clave es la IP de origen como entero (ver _ip_to_int)
+        # Ej: {16909060: deque([timestamp1, timestamp2, ...], maxlen=umbral+1)}
+        # Cada 'deque' es un buffer circular: solo necesitamos los últimos
+        # 'umbral + 1' timestamps para saber si se superó el umbral en la ventana.
+        # Así la memoria por IP está acotada aunque la IP nos inunde de paquetes.
+        self.trafico_reciente = defaultdict(lambda: deque(maxlen=self.umbral + 1))
+        # Cada '_gc_interval' paquetes se eliminan las IPs sin actividad reciente,
+        # para que la memoria dependa de las IPs ACTIVAS y no de todas las vistas.
+        self._ops_since_gc = 0
+        self._gc_interval = 4096
+        logger.info("Detector Heurístico (Anti-DDoS/Scan) inicializado.")
 
     def analizar_paquete(self, paquete: Paquete) -> (bool, str):
-        tiempo_actual = time.time()
+        razon = self._detectar(paquete)
+        if razon is not None:
+            return (True, razon)
+        return (False, "Comportamiento de tráfico normal")
+
+    def _detectar(self, paquete: Paquete, tiempo_actual: float | None = None) -> str | None:
+        """
+        Registra el paquete en el historial de su IP.
+        Retorna la razón si el paquete es sospechoso, o None si es normal.
+        'tiempo_actual' permite pasar el timestamp de un lote; si no, se lee el reloj.
+        """
+        if tiempo_actual is None:
+            tiempo_actual = time.time()
         
-        ip_origen = paquete.origen
+        ip_origen = paquete.origen_int
         
-        # 1. Limpiar historial viejo para esta IP
-        # Mantenemos solo los timestamps dentro de la ventana de tiempo
+        # 1. Agregar el paquete actual al historial
+        # Al estar lleno, el deque descarta solo el timestamp más viejo (O(1))
         historial_ip = self.trafico_reciente[ip_origen]
-        historial_valido = [t for t in historial_ip if tiempo_actual - t < self.ventana]
+        # El análisis supone timestamps en orden creciente: si nos llega un
+        # tiempo anterior al último registrado (ej: un lote con 'ts' viejo),
+        # lo igualamos al último en vez de desordenar el historial.
+        if historial_ip and tiempo_actual < historial_ip[-1]:
+            tiempo_actual = historial_ip[-1]
+        historial_ip.append(tiempo_actual) # <-- MANTIENE ESTADO INTERNO
         
-        # 2. Agregar el paquete actual al historial
-        historial_valido.append(tiempo_actual)
-        self.trafico_reciente[ip_origen] = historial_valido # <-- MANTIENE ESTADO INTERNO
-        
-        # 3. Analizar
-        if len(historial_valido) > self.umbral:
+        # 2. Analizar
+        # Si el buffer está lleno y su timestamp más viejo sigue dentro de la
+        # ventana, hubo más de 'umbral' paquetes en 'ventana' segundos.
+        if len(historial_ip) > self.umbral and tiempo_actual - historial_ip[0] < self.ventana:
+            total = len(historial_ip)
             # Borramos el historial para esta IP para no reportarla mil veces
-            self.trafico_reciente[ip_origen] = [] 
-            return (True, f"Posible DDoS/Scan. {len(historial_valido)} paquetes en {self.ventana}s.")
+            historial_ip.clear()
+            self._contar_operaciones(1, tiempo_actual)
+            return f"Posible DDoS/Scan. {total} paquetes en {self.ventana}s."
             
-        return (False, "Comportamiento de tráfico normal")
+        self._contar_operaciones(1, tiempo_actual)
+        return None
+
+    def _fuente_cadena(self, nombre: str) -> tuple[str, dict]:
+        if not self._analiza_con(DetectorHeuristico):
+            return super()._fuente_cadena(nombre)
+        return self._fuente_detectar(nombre)
+
+    def analizar_lote(self, paquetes: list[Paquete], tiempo: float) -> list[bool]:
+        if not self._analiza_con(DetectorHeuristico):
+            return super().analizar_lote(paquetes, tiempo)
+        # Misma lógica que _detectar(), pero en un único bucle con todo lo
+        # necesario en variables locales: sin una llamada por paquete ni
+        # f-strings de razón. Todo el lote comparte el mismo 'tiempo' y el
+        # orden dentro del lote lo da la posición en la lista.
+        trafico_reciente = self.trafico_reciente
+        umbral = self.umbral
+        ventana = self.ventana
+        marcas = []
+        marcar = marcas.append
+        for paquete in paquetes:
+            historial_ip = trafico_reciente[paquete.origen_int]
+            ahora = tiempo
+            if historial_ip and ahora < historial_ip[-1]:
+                ahora = historial_ip[-1] # El tiempo no retrocede (ver _detectar)
+            historial_ip.append(ahora)
+            if len(historial_ip) > umbral and ahora - historial_ip[0] < ventana:
+                historial_ip.clear()
+                marcar(True)
+            else:
+                marcar(False)
+        # La compactación se cuenta una vez por lote, no por paquete
+        self._contar_operaciones(len(paquetes), tiempo)
+        return marcas
+
+    def _contar_operaciones(self, cantidad: int, tiempo_actual: float):
+        """Cuenta paquetes analizados y compacta el historial cada '_gc_interval'."""
+        self._ops_since_gc += cantidad
+        if self._ops_since_gc < self._gc_interval:
+            return
+        self._ops_since_gc = 0
+        # Una IP cuyo último paquete ya salió de la ventana no puede aportar
+        # a ninguna detección futura: se puede olvidar sin cambiar resultados.
+        limite = tiempo_actual - self.ventana
+        inactivas = [ip for ip, historial in self.trafico_reciente.items()
+                     if not historial or historial[-1] <= limite]
+        for ip in inactivas:
+            del self.trafico_reciente[ip]
 
 
 # --- 4. La Red (Firewall) con Cadena de Responsabilidad ---
 
+def _compilar_cadena(detectores: list[DetectorBase]) -> Callable[[Paquete], tuple | None]:
+    """
+    Genera en tiempo de ejecución UNA función que recorre los detectores en orden,
+    pegando el fragmento de código de cada uno (ver DetectorBase._fuente_cadena).
+    La función retorna (detector, razon) con el primero que bloquea el paquete,
+    o None si es benigno: sin bucle y sin tuplas en el camino común.
+    Los fragmentos llaman a métodos de cada detector (no copian su lógica ni
+    su configuración), así que cambiar un detector después sigue funcionando.
+    """
+    lineas = ["def _cadena(p):\n"]
+    variables = {}
+    for i, detector in enumerate(detectores):
+        fuente, nombres = detector._fuente_cadena(f"d{i}")
+        lineas.append(fuente)
+        variables.update(nombres)
+    lineas.append("    return None\n")
+    exec(compile("".join(lineas), "<netguard-cadena>", "exec"), variables)
+    return variables["_cadena"]
+
+
 class Red:
     """
     Simula la red y actúa como un Firewall.
     Utiliza COMPOSICIÓN para mantener una lista de detectores.
     Aplica el patrón "Chain of Responsibility" (Cadena de Responsabilidad).
     """
-    def __init__(self):
+    # Segundos durante los que un veredicto cacheado sigue siendo válido
+    _cache_ttl = 1.0
+    # Máximo de entradas en el caché (se descartan las menos usadas recientemente)
+    _cache_max = 10_000
+
+    def __init__(self, cache_veredictos: bool = False):
         # La red "tiene" una lista de detectores.
         self.detectores: list[DetectorBase] = []
+        # Caché LRU (opcional) de veredictos de los detectores cacheables (ver 'es_cacheable').
+        # Durante una inundación el mismo paquete se repite miles de veces;
+        # así no volvemos a correr las reglas/blacklist para cada copia.
+        # Está desactivado por defecto: con tráfico variado (ej: escaneos con
+        # IPs falsificadas) mantenerlo cuesta más que los detectores que se ahorra.
+        # Ej: {(origen, tipo, datos, amenaza): (timestamp, detector | None, razon)}
+        self.cache_veredictos = cache_veredictos
+        self._verdict_cache: OrderedDict[tuple, tuple] = OrderedDict()
+        # Suma de las versiones de los detectores cacheables con la que se armó
+        # el caché: si un detector cambia su configuración, la suma cambia.
+        self._version_cache = 0
+        # La cadena dividida en dos tramos:
+        # - el tramo inicial de detectores cacheables
+        # - el resto de la cadena, que se ejecuta siempre
+        # Cada tramo se compila en una sola función (ver _compilar_cadena)
+        # que se regenera cada vez que se agrega un detector.
+        self._detectores_cacheables: list[DetectorBase] = []
+        self._detectores_con_estado: list[DetectorBase] = []
+        self._cadena_cacheable = _compilar_cadena(self._detectores_cacheables)
+        self._cadena_con_estado = _compilar_cadena(self._detectores_con_estado)
         self.paquetes_procesados = 0
         self.paquetes_bloqueados = 0
         self.paquetes_permitidos = 0
         self.paquetes_corruptos = 0
-        print("Red virtual 'NetGuard v2' (Firewall en capas) está en línea.")
+        logger.info("Red virtual 'NetGuard v2' (Firewall en capas) está en línea.")
 
     def agregar_detector(self, detector: DetectorBase):
         """
         Inyección de Dependencia: La red recibe los detectores
         en lugar de crearlos ella misma.
+        Lanza TypeError si el objeto no es un 'DetectorBase'.
         """
         # Verificamos que el objeto CUMPLE con la interfaz
-        if isinstance(detector, DetectorBase):
-            self.detectores.append(detector)
-            print(f"Detector '{detector}' agregado a la cadena de seguridad.")
+        if not isinstance(detector, DetectorBase):
+            raise TypeError(f"El objeto {detector!r} no es un 'DetectorBase' válido.")
+
+        self.detectores.append(detector)
+        # Solo el tramo INICIAL de la cadena se cachea: un detector con estado
+        # debe seguir viendo exactamente los mismos paquetes que antes.
+        if detector.es_cacheable and not self._detectores_con_estado:
+            self._detectores_cacheables.append(detector)
+            self._cadena_cacheable = _compilar_cadena(self._detectores_cacheables)
         else:
-            print(f"Error: El objeto {detector} no es un 'DetectorBase' válido.")
+            self._detectores_con_estado.append(detector)
+            self._cadena_con_estado = _compilar_cadena(self._detectores_con_estado)
+        # La cadena cambió: los veredictos guardados ya no son válidos
+        self._verdict_cache.clear()
+        logger.info("Detector '%s' agregado a la cadena de seguridad.", detector)
 
     def procesar_paquete(self, paquete: Paquete):
         """
         Procesa un paquete, validándolo y pasándolo por la cadena
         de detectores en orden.
         """
-        self.paquetes_procesados += 1
-        
         try:
             # 1. Validación de sanidad (Encapsulación del paquete)
             paquete.validar()
-            print(f"\nAnalizando paquete: {paquete}")
-            
-            # 2. Cadena de Responsabilidad (Polimorfismo)
-            for detector in self.detectores:
-                # <-- ¡POLIMORFISMO EN ACCIÓN! -->
-                # La Red no sabe (ni le importa) qué TIPO de detector es.
-                # Solo sabe que puede llamar a ".analizar_paquete()".
-                es_amenaza, razon = detector.analizar_paquete(paquete)
-                
-                if es_amenaza:
-                    self.paquetes_bloqueados += 1
-                    print(f"🔴 [BLOQUEADO] Razón: {razon} (Detectado por: {detector})")
-                    return # Si un detector lo bloquea, los siguientes no se ejecutan
-            
-            # 3. Si pasa todos los filtros
-            self.paquetes_permitidos += 1
-            print(f"🟢 [PERMITIDO] Razón: Pasó todos los {len(self.detectores)} filtros.")
-
         except PaqueteCorruptoError as e:
             # Manejo de nuestra excepción personalizada
+            self._registrar_veredicto(paquete, "DESCARTADO", e, None)
+            return
+
+        # <-- ¡POLIMORFISMO EN ACCIÓN! -->
+        # La Red no sabe (ni le importa) qué TIPO de detector es: cada uno
+        # aportó su propio código a la cadena compilada.
+        # Si un detector lo bloquea, los siguientes no se ejecutan.
+        # 2. Tramo de detectores cacheables (sin estado: blacklist, reglas)
+        detector, razon = self._analizar_cacheables(paquete)
+        if detector is None:
+            # 3. Si nadie lo resolvió, el resto de la cadena (con estado)
+            bloqueo = self._cadena_con_estado(paquete)
+            if bloqueo is not None:
+                detector, razon = bloqueo
+
+        if detector is not None:
+            self._registrar_veredicto(paquete, "BLOQUEADO", razon, detector)
+        else:
+            # Si pasa todos los filtros
+            self._registrar_veredicto(paquete, "PERMITIDO", None, None)
+
+    def _registrar_veredicto(self, paquete: Paquete, estado: str, razon, detector: DetectorBase | None):
+        """Actualiza las estadísticas y reporta el veredicto."""
+        self.paquetes_procesados += 1
+        if estado == "BLOQUEADO":
+            self.paquetes_bloqueados += 1
+        elif estado == "PERMITIDO":
+            self.paquetes_permitidos += 1
+        else:
             self.paquetes_corruptos += 1
-            print(f"\n🟡 [DESCARTADO] Paquete corrupto. Error: {e}")
-            
-        finally:
-            time.sleep(0.05) # Pausa para legibilidad
+
+        # Los mensajes (y el __repr__ del paquete) solo se arman si alguien
+        # los va a ver; en modo silencioso/benchmark no cuestan nada.
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        if estado == "DESCARTADO":
+            logger.info("\n🟡 [DESCARTADO] Paquete corrupto. Error: %s", razon)
+            return
+        logger.info("\nAnalizando paquete: %r", paquete)
+        if estado == "BLOQUEADO":
+            logger.info("🔴 [BLOQUEADO] Razón: %s (Detectado por: %s)", razon, detector)
+        else:
+            logger.info("🟢 [PERMITIDO] Razón: Pasó todos los %d filtros.", len(self.detectores))
+
+    def procesar_lote(self, paquetes: list[Paquete], ts: float | None = None):
+        """
+        Procesa varios paquetes de una vez (modo batch).
+        'ts' es el momento de llegada del lote; si no se indica se lee el
+        reloj UNA sola vez para todo el lote.
+        Cada detector analiza el lote completo en una sola llamada y solo
+        los paquetes que no bloqueó pasan al siguiente detector (igual que en
+        procesar_paquete()).
+        OJO: todos los paquetes del lote comparten el mismo 'ts', así que los
+        detectores con ventana de tiempo (ej: el heurístico) los ven como
+        llegados en el mismo instante. Un lote puede bloquear paquetes que,
+        procesados uno por uno y espaciados en el tiempo, habrían pasado.
+        Un 'ts' anterior a paquetes ya vistos se trata como "ahora" (el tiempo
+        no retrocede dentro de los historiales).
+        No registra un mensaje por paquete, solo un resumen del lote.
+        """
+        ts = time.time() if ts is None else ts
+
+        # 1. Validación de sanidad: los corruptos se descartan antes de la cadena
+        pendientes = []
+        for paquete in paquetes:
+            try:
+                paquete.validar()
+                pendientes.append(paquete)
+            except PaqueteCorruptoError:
+                pass
+        validos = len(pendientes)
+
+        # 2. Cadena de Responsabilidad, un lote a la vez
+        for detector in self.detectores:
+            if not pendientes:
+                break
+            marcas = detector.analizar_lote(pendientes, ts)
+            pendientes = [p for p, es_amenaza in zip(pendientes, marcas) if not es_amenaza]
+
+        # 3. Estadísticas
+        bloqueados = validos - len(pendientes)
+        self.paquetes_procesados += len(paquetes)
+        self.paquetes_corruptos += len(paquetes) - validos
+        self.paquetes_bloqueados += bloqueados
+        self.paquetes_permitidos += len(pendientes)
+        logger.info("Lote de %d paquetes: %d bloqueados, %d permitidos, %d descartados.",
+                    len(paquetes), bloqueados, len(pendientes), len(paquetes) - validos)
+
+    def _analizar_cacheables(self, paquete: Paquete) -> tuple:
+        """
+        Corre el tramo inicial de la cadena formado por detectores cacheables,
+        reutilizando el veredicto si el mismo paquete se vio hace poco
+        (solo con 'cache_veredictos' activado).
+        Retorna (detector_que_bloqueo | None, razon).
+        """
+        if not self.cache_veredictos:
+            return self._cadena_cacheable(paquete) or (None, "")
+
+        # ¿Cambió la configuración de algún detector? Entonces nada de lo guardado sirve
+        version = sum(d._version for d in self._detectores_cacheables)
+        if version != self._version_cache:
+            self._verdict_cache.clear()
+            self._version_cache = version
+
+        ahora = time.time()
+        clave = (paquete.origen, paquete.tipo, paquete.datos, paquete.nivel_amenaza)
+        cacheado = self._verdict_cache.get(clave)
+        if cacheado is not None and ahora - cacheado[0] < self._cache_ttl:
+            # LRU: el veredicto recién usado pasa al final (el último en descartarse)
+            self._verdict_cache.move_to_end(clave)
+            return (cacheado[1], cacheado[2])
+
+        veredicto = self._cadena_cacheable(paquete) or (None, "")
+
+        self._verdict_cache[clave] = (ahora, *veredicto)
+        self._verdict_cache.move_to_end(clave)
+        if len(self._verdict_cache) > self._cache_max:
+            self._verdict_cache.popitem(last=False)
+        return veredicto
 
     def obtener_estadisticas(self) -> dict:
         return {
@@ -219,9 +726,16 @@ class Red:
 class Simulador:
     """
     Crea todos los objetos (composición) y los "conecta".
-    Gestiona el bucle principal.
+    Gestiona el bucle principal (asíncrono: el menú y las ráfagas corren a la vez).
     """
-    def __init__(self):
+    def __init__(self, interactive: bool = False):
+        # En modo interactivo las ráfagas se pausan entre paquetes para que la
+        # salida sea legible. La pausa es un 'await asyncio.sleep()', así que
+        # no bloquea el menú. En modo batch (por defecto) no hay pausas.
+        self.interactive = interactive
+        self._pausa = 0.15 if interactive else 0.0
+        # Ráfagas corriendo en segundo plano (tareas de asyncio)
+        self._rafagas: set[asyncio.Task] = set()
         # 1. Definir nuestra configuración de seguridad
         blacklist_ips = {"104.20.15.12", "198.51.100.45"}
         
@@ -245,41 +759,75 @@ class Simulador:
         self._ips_externas = [f"104.20.{random.randint(10, 50)}.{random.randint(1, 254)}" for _ in range(5)]
         # Añadimos una IP de la blacklist para probar
         self._ips_externas.append("104.20.15.12") 
+        # Tráfico posible como tuplas (tipo, datos, amenaza), construido UNA sola vez
+        self._trafico_posible = [
+            ("HTTP", "GET /index.html", 0),
+            ("DNS", "Query: google.com", 0),
+            ("SCAN_PUERTOS", "NMAP -sS", 6),
+            ("HTTP", "GET /login.php?user=' OR '1'='1", 8),
+            ("MALFORMADO", "x@!#\0", 0), # Paquete para probar excepción
+        ]
 
-    def _generar_paquete_aleatorio(self) -> Paquete:
-        trafico_posible = [
-            {"tipo": "HTTP", "datos": "GET /index.html", "amenaza": 0},
-            {"tipo": "DNS", "datos": "Query: google.com", "amenaza": 0},
-            {"tipo": "SCAN_PUERTOS", "datos": "NMAP -sS", "amenaza": 6},
-            {"tipo": "HTTP", "datos": "GET /login.php?user=' OR '1'='1", "amenaza": 8},
-            {"tipo": "MALFORMADO", "datos": "x@!#\0", "amenaza": 0}, # Paquete para probar excepción
+    def _generar_lote(self, cantidad: int) -> list[Paquete]:
+        """
+        Genera 'cantidad' paquetes aleatorios de una vez.
+        Sortea cada campo para todo el lote con random.choices()
+        en lugar de hacer varias llamadas a random.choice() por paquete.
+        """
+        tipos = random.choices(self._trafico_posible, k=cantidad)
+        origenes = random.choices(self._ips_externas, k=cantidad)
+        destinos = random.choices(self._ips_simuladas, k=cantidad)
+        return [
+            Paquete(origen, destino, tipo, datos, amenaza)
+            for origen, destino, (tipo, datos, amenaza) in zip(origenes, destinos, tipos)
         ]
-        
-        eleccion = random.choice(trafico_posible)
-        origen = random.choice(self._ips_externas)
-        destino = random.choice(self._ips_simuladas)
-
-        return Paquete(
-            origen=origen,
-            destino=destino,
-            tipo=eleccion["tipo"],
-            datos=eleccion["datos"],
-            nivel_amenaza=eleccion["amenaza"]
-        )
-
-    def simular_rafaga(self, cantidad: int):
-        print(f"\n--- Iniciando ráfaga de {cantidad} paquetes ---")
-        for i in range(cantidad):
-            # Para probar el detector heurístico, simulamos un ataque
-            if i > (cantidad - 5) and cantidad >= 10:
-                print("... (Simulando ráfaga de ataque)...")
-                paquete_nuevo = Paquete("8.8.4.4", "192.168.1.10", "DDoS", "SYN Flood", 7)
-            else:
-                paquete_nuevo = self._generar_paquete_aleatorio()
-            
-            self.red.procesar_paquete(paquete_nuevo)
-            time.sleep(0.1)
-        print("--- Ráfaga completada ---")
+
+    def simular_rafaga(self, cantidad: int, quiet: bool = False):
+        """
+        Genera y procesa 'cantidad' paquetes.
+        Con quiet=True se silencian los mensajes por paquete (solo WARNING o superior).
+        """
+        if quiet:
+            nivel_anterior = logger.level
+            logger.setLevel(logging.WARNING)
+        try:
+            self._procesar_rafaga(cantidad)
+        finally:
+            if quiet:
+                logger.setLevel(nivel_anterior)
+
+    def _procesar_rafaga(self, cantidad: int):
+        # Modo batch: la ráfaga completa se procesa como un solo lote
+        logger.info("\n--- Iniciando ráfaga de %d paquetes ---", cantidad)
+        self.red.procesar_lote(self._armar_rafaga(cantidad))
+        logger.info("--- Ráfaga completada ---")
+
+    async def simular_rafaga_async(self, cantidad: int):
+        """
+        Igual que simular_rafaga(), pero paquete a paquete y cediendo el control
+        al event loop entre paquetes, para que el menú siga respondiendo.
+        """
+        logger.info("\n--- Iniciando ráfaga de %d paquetes ---", cantidad)
+        for paquete in self._armar_rafaga(cantidad):
+            self.red.procesar_paquete(paquete)
+            await asyncio.sleep(self._pausa) # Pausa para legibilidad (sin bloquear)
+        logger.info("--- Ráfaga completada ---")
+
+    def _armar_rafaga(self, cantidad: int) -> list[Paquete]:
+        """Genera los paquetes de una ráfaga, terminando con un ataque si es larga."""
+        # Para probar el detector heurístico, los últimos paquetes simulan un ataque
+        ataques = 4 if cantidad >= 10 else 0
+        paquetes = self._generar_lote(cantidad - ataques)
+        if ataques:
+            logger.info("... (Simulando ráfaga de ataque: %d paquetes)...", ataques)
+            paquetes += [Paquete("8.8.4.4", "192.168.1.10", "DDoS", "SYN Flood", 7) for _ in range(ataques)]
+        return paquetes
+
+    def _lanzar_rafaga(self, cantidad: int):
+        """Arranca una ráfaga como tarea en segundo plano y vuelve enseguida al menú."""
+        tarea = asyncio.create_task(self.simular_rafaga_async(cantidad))
+        self._rafagas.add(tarea)
+        tarea.add_done_callback(self._rafagas.discard)
 
     def mostrar_reporte(self):
         stats = self.red.obtener_estadisticas()
@@ -289,8 +837,42 @@ class Simulador:
         print(f"  Paquetes Bloqueados: {stats['Total Bloqueados']}")
         print(f"  Paquetes Corruptos/Descartados: {stats['Total Corruptos']}")
         print("----------------------------------")
+        if self._rafagas:
+            print(f"  (Ráfagas aún en curso: {len(self._rafagas)})")
 
     def iniciar_interfaz_admin(self):
+        with mensajes_en_consola():
+            try:
+                asyncio.run(self._interfaz_admin())
+            except KeyboardInterrupt:
+                print("\nCerrando NetGuard (Ctrl-C). La red ya no está monitoreada.")
+
+    def _iniciar_lector_teclado(self) -> asyncio.Queue:
+        """
+        Lee el teclado en un hilo 'daemon' y entrega cada línea al event loop
+        por una cola. Así el menú no bloquea las ráfagas, y al salir (o con
+        Ctrl-C) el programa no queda esperando a un input() que nunca termina:
+        un hilo daemon no impide que el proceso finalice.
+        Una línea vacía ("") en la cola significa fin de la entrada (EOF).
+        """
+        loop = asyncio.get_running_loop()
+        lineas: asyncio.Queue[str] = asyncio.Queue()
+
+        def leer():
+            while True:
+                linea = sys.stdin.readline()
+                try:
+                    loop.call_soon_threadsafe(lineas.put_nowait, linea)
+                except RuntimeError: # El event loop ya se cerró
+                    return
+                if not linea:
+                    return
+
+        threading.Thread(target=leer, name="netguard-teclado", daemon=True).start()
+        return lineas
+
+    async def _interfaz_admin(self):
+        lineas = self._iniciar_lector_teclado()
         print("======================================================")
         print("  Bienvenido a la Consola de NetGuard v2 (Firewall)  ")
         print("======================================================")
@@ -301,12 +883,16 @@ class Simulador:
             print("  2. Simular ráfaga de 15 paquetes (incluye prueba de DDoS)")
             print("  3. Ver reporte de red")
             print("  4. Salir")
-            opcion = input("Seleccione una opción: ")
+            # Mientras el administrador escribe, las ráfagas siguen procesando paquetes
+            print("Seleccione una opción: ", end="", flush=True)
+            linea = await lineas.get()
+            # Fin de la entrada (ej: Ctrl-D o un archivo redirigido): salimos
+            opcion = linea.strip() if linea else '4'
 
             if opcion == '1':
-                self.simular_rafaga(cantidad=1)
+                self._lanzar_rafaga(cantidad=1)
             elif opcion == '2':
-                self.simular_rafaga(cantidad=15)
+                self._lanzar_rafaga(cantidad=15)
             elif opcion == '3':
                 self.mostrar_reporte()
             elif opcion == '4':
@@ -315,8 +901,16 @@ class Simulador:
             else:
                 print("Opción no válida. Intente de nuevo.")
 
+        # Esperamos a que terminen las ráfagas en curso, para no perder paquetes
+        if self._rafagas:
+            logger.info("Esperando %d ráfaga(s) en curso...", len(self._rafagas))
+            await asyncio.gather(*self._rafagas, return_exceptions=True)
+            self.mostrar_reporte()
+
 
 # --- Punto de Entrada Principal ---
 if __name__ == "__main__":
-    simulador = Simulador()
+    # Los mensajes de arranque (detectores, red) también se ven en la consola
+    with mensajes_en_consola():
+        simulador = Simulador(interactive=True)
     simulador.iniciar_interfaz_admin()
\ No newline at end of file